@@ -1,8 +1,11 @@
 import os
+import json
 import shutil
 import time
 import logging
 import asyncio
+from contextlib import asynccontextmanager
+from collections import defaultdict, deque
 from typing import List, Dict, Optional
 
 from pyrogram import Client, filters, enums
@@ -16,6 +19,7 @@ from helpers.utils import (
     get_readable_time,
     UserSettings
 )
+from helpers.user_cache import get_user
 
 # Configure logging
 logging.basicConfig(
@@ -24,6 +28,45 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Serialises read-modify-write of a user's queue across concurrent updates,
+# entries only live while someone holds or waits on them
+_user_locks: Dict[int, asyncio.Lock] = {}
+_user_lock_refs: Dict[int, int] = defaultdict(int)
+
+# FFmpeg is multi-threaded itself, so use half the cores for merge jobs
+MERGE_WORKERS = max(1, (os.cpu_count() or 2) // 2)
+
+# Concurrent downloads per merge job
+MAX_PARALLEL_DOWNLOADS = 4
+
+# Concurrent ffprobe processes per merge job
+MAX_PARALLEL_PROBES = 4
+
+# Telegram's getMessages accepts at most this many ids per call
+GET_MESSAGES_LIMIT = 200
+
+# Minimum seconds between progress message edits
+PROGRESS_EDIT_INTERVAL = 5
+
+# Bytes promised to merges currently staged in Config.TMP_DIR
+_tmp_reserved = 0
+
+# Largest share of TMP_DIR's free space a single merge may take
+TMP_DIR_MAX_USAGE = 0.5
+
+# Idle 'waiting' queues are dropped after QUEUE_TTL seconds
+QUEUE_TTL = 3600
+QUEUE_SWEEP_INTERVAL = 600
+
+# Static keyboards, built once
+START_MARKUP = InlineKeyboardMarkup([
+    [InlineKeyboardButton("Help", callback_data="help")]
+])
+QUEUE_MARKUP = InlineKeyboardMarkup([
+    [InlineKeyboardButton("Merge Now", callback_data="merge_now")],
+    [InlineKeyboardButton("Clear Queue", callback_data="clear_queue")]
+])
+
 class VideoMergerBot(Client):
     def __init__(self):
         super().__init__(
@@ -35,11 +78,18 @@ class VideoMergerBot(Client):
             plugins=dict(root="plugins")
         )
         self.queue = {}
-        self.user_settings = {}
+        self.merge_queue: asyncio.Queue = asyncio.Queue()
+        self._merge_workers: List[asyncio.Task] = []
+        self._sweeper: Optional[asyncio.Task] = None
         self.bot_start_time = time.time()
 
     async def start(self):
         await super().start()
+        self._merge_workers = [
+            asyncio.create_task(merge_worker(self))
+            for _ in range(MERGE_WORKERS)
+        ]
+        self._sweeper = asyncio.create_task(self._sweep_queues())
         logger.info("Bot started successfully")
         try:
             await self.send_message(
@@ -50,6 +100,12 @@ class VideoMergerBot(Client):
             logger.error(f"Failed to send startup message: {e}")
 
     async def stop(self):
+        for task in self._merge_workers:
+            task.cancel()
+        self._merge_workers = []
+        if self._sweeper:
+            self._sweeper.cancel()
+            self._sweeper = None
         await super().stop()
         logger.info("Bot stopped")
 
@@ -60,9 +116,11 @@ class VideoMergerBot(Client):
                 'videos': [],
                 'status': 'waiting',
                 'start_time': None,
-                'last_msg': None
+                'last_msg': None,
+                'last_active': None
             }
-        
+        self.queue[user_id]['last_active'] = time.time()
+
         media = message.video or message.document
         if not media:
             return False
@@ -75,11 +133,33 @@ class VideoMergerBot(Client):
         })
         return True
 
+    async def _sweep_queues(self):
+        """Periodically drop queues abandoned before /merge"""
+        while True:
+            await asyncio.sleep(QUEUE_SWEEP_INTERVAL)
+            expired = time.time() - QUEUE_TTL
+            for user_id, state in list(self.queue.items()):
+                if state['status'] == 'waiting' and state['last_active'] < expired:
+                    self.queue.pop(user_id, None)
+                    logger.info(f"Dropped idle queue of {user_id}")
+
     async def get_user_settings(self, user_id: int) -> UserSettings:
         """Get or create user settings"""
-        if user_id not in self.user_settings:
-            self.user_settings[user_id] = UserSettings(user_id, "")
-        return self.user_settings[user_id]
+        return await get_user(user_id, "")
+
+@asynccontextmanager
+async def _user_lock(user_id: int):
+    """Hold the user's queue lock, forgetting it once unused"""
+    lock = _user_locks.setdefault(user_id, asyncio.Lock())
+    _user_lock_refs[user_id] += 1
+    try:
+        async with lock:
+            yield
+    finally:
+        _user_lock_refs[user_id] -= 1
+        if not _user_lock_refs[user_id]:
+            del _user_lock_refs[user_id]
+            _user_locks.pop(user_id, None)
 
 bot = VideoMergerBot()
 
@@ -90,9 +170,7 @@ async def start_handler(client: VideoMergerBot, message: Message):
         "🎥 Welcome to Video Merger Bot!\n\n"
         "Send me multiple videos to merge them together.\n"
         "Use /help for more instructions.",
-        reply_markup=InlineKeyboardMarkup([
-            [InlineKeyboardButton("Help", callback_data="help")]
-        ])
+        reply_markup=START_MARKUP
     )
 
 @bot.on_message(filters.video | filters.document & filters.private)
@@ -111,75 +189,159 @@ async def video_handler(client: VideoMergerBot, message: Message):
         return
 
     # Add to queue
-    added = await client.add_to_queue(message.from_user.id, message)
-    if not added:
-        await message.reply_text("Failed to add video to queue.")
-        return
-
-    queue_size = len(client.queue[message.from_user.id]['videos'])
-    reply_msg = await message.reply_text(
-        f"✅ Video added to queue!\n\n"
-        f"📊 Queue size: {queue_size}\n"
-        f"📌 Send more videos or press /merge when ready.",
-        reply_markup=InlineKeyboardMarkup([
-            [InlineKeyboardButton("Merge Now", callback_data="merge_now")],
-            [InlineKeyboardButton("Clear Queue", callback_data="clear_queue")]
-        ])
-    )
+    async with _user_lock(message.from_user.id):
+        # The running merge pops the queue when done, so don't accept more yet
+        if client.queue.get(message.from_user.id, {}).get('status') == 'processing':
+            await message.reply_text("⏳ Please wait until your current merge finishes.")
+            return
+
+        added = await client.add_to_queue(message.from_user.id, message)
+        if not added:
+            await message.reply_text("Failed to add video to queue.")
+            return
+
+        queue_size = len(client.queue[message.from_user.id]['videos'])
+        reply_msg = await message.reply_text(
+            f"✅ Video added to queue!\n\n"
+            f"📊 Queue size: {queue_size}\n"
+            f"📌 Send more videos or press /merge when ready.",
+            reply_markup=QUEUE_MARKUP
+        )
 
-    # Store last message for editing
-    client.queue[message.from_user.id]['last_msg'] = reply_msg.id
+        # Store last message for editing
+        client.queue[message.from_user.id]['last_msg'] = reply_msg.id
 
 @bot.on_message(filters.command(["merge"]) & filters.private)
 async def merge_handler(client: VideoMergerBot, message: Message):
     """Handle merge command"""
     user_id = message.from_user.id
-    if user_id not in client.queue or not client.queue[user_id]['videos']:
-        await message.reply_text("Your queue is empty!")
-        return
+    async with _user_lock(user_id):
+        if user_id not in client.queue or not client.queue[user_id]['videos']:
+            await message.reply_text("Your queue is empty!")
+            return
 
-    if len(client.queue[user_id]['videos']) < 2:
-        await message.reply_text("You need at least 2 videos to merge!")
-        return
+        if len(client.queue[user_id]['videos']) < 2:
+            await message.reply_text("You need at least 2 videos to merge!")
+            return
 
-    # Start merging process
-    client.queue[user_id]['status'] = 'processing'
-    client.queue[user_id]['start_time'] = time.time()
+        if client.queue[user_id]['status'] != 'waiting':
+            await message.reply_text("Your merge is already in progress!")
+            return
 
-    status_msg = await message.reply_text(
-        "🔄 Starting merge process...\n"
-        "⏳ This may take some time depending on video sizes."
+        client.queue[user_id]['status'] = 'queued'
+
+    # Hand off to the bounded worker pool
+    await client.merge_queue.put(message)
+    await message.reply_text(
+        f"🕒 Added to merge queue.\n"
+        f"📊 Position: {client.merge_queue.qsize()}"
     )
 
+async def merge_worker(client: VideoMergerBot):
+    """Run queued merge jobs one at a time"""
+    while True:
+        message = await client.merge_queue.get()
+        try:
+            await process_merge(client, message)
+        except Exception as e:
+            logger.error(f"Merge worker error: {e}")
+        finally:
+            client.merge_queue.task_done()
+
+async def process_merge(client: VideoMergerBot, message: Message):
+    """Download, merge and upload a user's queued videos"""
+    global _tmp_reserved
+    user_id = message.from_user.id
+    async with _user_lock(user_id):
+        # Start merging process
+        client.queue[user_id]['status'] = 'processing'
+        client.queue[user_id]['start_time'] = time.time()
+
+    status_msg = None
+    download_dir = f"downloads/{user_id}"
+    reserved = 0
     try:
-        # Create download directory
-        download_dir = f"downloads/{user_id}"
+        status_msg = await message.reply_text(
+            "🔄 Starting merge process...\n"
+            "⏳ This may take some time depending on video sizes."
+        )
+
+        # Create download directory, staged in tmpfs when inputs plus output fit
+        videos = list(client.queue[user_id]['videos'])
+        needed = 2 * sum(video['file_size'] or 0 for video in videos)
+        try:
+            # tmpfs is RAM: count space promised to parallel jobs and keep headroom
+            free = shutil.disk_usage(Config.TMP_DIR).free - _tmp_reserved
+            if needed <= free * TMP_DIR_MAX_USAGE:
+                download_dir = f"{Config.TMP_DIR}/merge_{user_id}"
+                os.makedirs(download_dir, exist_ok=True)
+                reserved = needed
+                _tmp_reserved += reserved
+        except OSError as e:
+            logger.warning(f"Can't stage merge in {Config.TMP_DIR}: {e}")
+            download_dir = f"downloads/{user_id}"
+            reserved = 0
         os.makedirs(download_dir, exist_ok=True)
 
-        # Download videos
-        downloaded_files = []
-        for idx, video in enumerate(client.queue[user_id]['videos']):
+        # Download videos concurrently, bounded to keep the session healthy
+        sem = asyncio.Semaphore(MAX_PARALLEL_DOWNLOADS)
+        done = finished = 0
+        next_edit = 0.0
+
+        # Fetch queued messages in batches instead of one request per video
+        dl_msgs: List[Optional[Message]] = []
+        for i in range(0, len(videos), GET_MESSAGES_LIMIT):
+            batch = videos[i:i + GET_MESSAGES_LIMIT]
+            try:
+                dl_msgs += await client.get_messages(
+                    message.chat.id,
+                    [video['message_id'] for video in batch]
+                )
+            except Exception as e:
+                logger.error(f"Failed to fetch queued messages: {e}")
+                dl_msgs += [None] * len(batch)
+
+        async def _dl(idx: int, video: Dict, dl_msg: Optional[Message]) -> Optional[str]:
+            nonlocal done, finished, next_edit
+            file_path = None
+            async with sem:
+                try:
+                    if dl_msg is None or dl_msg.empty:
+                        raise ValueError("message not found")
+                    # Prefix with the queue index so equal names don't clash
+                    file_path = f"{download_dir}/{idx}_{video['file_name']}"
+                    await dl_msg.download(file_name=file_path)
+                    done += 1
+                except Exception as e:
+                    logger.error(f"Failed to download {video['file_name']}: {e}")
+                    file_path = None
+            finished += 1
+
+            # Throttle like progress_callback, but always show the last one
+            now = time.monotonic()
+            if finished != len(videos) and now < next_edit:
+                return file_path
+            next_edit = now + PROGRESS_EDIT_INTERVAL
             try:
-                file_path = f"{download_dir}/{video['file_name']}"
-                await message.reply_chat_action(enums.ChatAction.UPLOAD_VIDEO)
-                
-                edit_text = (
-                    f"📥 Downloading {idx+1}/{len(client.queue[user_id]['videos'])}\n"
+                await status_msg.edit_text(
+                    f"📥 Downloaded {done}/{len(videos)}\n"
                     f"📄 {video['file_name']}\n"
                     f"📦 {humanbytes(video['file_size'])}"
                 )
-                await status_msg.edit_text(edit_text)
-
-                dl_msg = await client.get_messages(
-                    message.chat.id,
-                    video['message_id']
-                )
-                await dl_msg.download(file_name=file_path)
-                downloaded_files.append(file_path)
-
+            except FloodWait as e:
+                next_edit = time.monotonic() + e.value
             except Exception as e:
-                logger.error(f"Failed to download {video['file_name']}: {e}")
-                continue
+                logger.error(f"Status update failed: {e}")
+            return file_path
+
+        await message.reply_chat_action(enums.ChatAction.UPLOAD_VIDEO)
+        results = await asyncio.gather(
+            *[
+                _dl(idx, video, dl_msg)
+                for idx, (video, dl_msg) in enumerate(zip(videos, dl_msgs))
+            ]
+        )
+        downloaded_files = [path for path in results if path]
 
         # Merge videos using FFmpeg
         if len(downloaded_files) >= 2:
@@ -201,45 +363,145 @@ async def merge_handler(client: VideoMergerBot, message: Message):
 
     except Exception as e:
         logger.error(f"Merge failed: {e}")
-        await status_msg.edit_text(f"❌ Merge failed: {str(e)}")
+        if status_msg:
+            try:
+                await status_msg.edit_text(f"❌ Merge failed: {str(e)}")
+            except Exception as err:
+                logger.error(f"Failed to report merge error: {err}")
     finally:
         # Cleanup
-        shutil.rmtree(download_dir, ignore_errors=True)
-        client.queue[user_id]['status'] = 'completed'
-        client.queue.pop(user_id, None)
-
-async def merge_videos_ffmpeg(input_files: List[str], output_file: str):
-    """Merge videos using FFmpeg"""
-    # Create input file list for FFmpeg
-    list_file = f"{output_file}.txt"
+        await asyncio.to_thread(shutil.rmtree, download_dir, ignore_errors=True)
+        _tmp_reserved -= reserved
+        async with _user_lock(user_id):
+            client.queue[user_id]['status'] = 'completed'
+            client.queue.pop(user_id, None)
+
+def _write_list(list_file: str, input_files: List[str]):
+    """Write FFmpeg concat demuxer input list"""
     with open(list_file, 'w') as f:
         for file in input_files:
             f.write(f"file '{file}'\n")
 
-    # FFmpeg command to concatenate videos
-    cmd = [
-        'ffmpeg',
-        '-f', 'concat',
-        '-safe', '0',
-        '-i', list_file,
-        '-c', 'copy',
-        output_file,
-        '-y'
-    ]
+async def _probe(path: str) -> tuple:
+    """Return the stream parameters that must match for a lossless concat
 
+    (vcodec, acodec, width, height, fps, timebase, pix_fmt, sample_rate, channels)
+    """
     proc = await asyncio.create_subprocess_exec(
-        *cmd,
+        'ffprobe',
+        '-v', 'error',
+        '-show_entries', 'stream=codec_type,codec_name,width,height,r_frame_rate,time_base,'
+                         'pix_fmt,sample_rate,channels',
+        '-of', 'json',
+        path,
         stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.DEVNULL
+    )
+    stdout, _ = await proc.communicate()
+    streams = json.loads(stdout or b"{}").get('streams', [])
+    video = next((st for st in streams if st.get('codec_type') == 'video'), {})
+    audio = next((st for st in streams if st.get('codec_type') == 'audio'), {})
+    return (
+        video.get('codec_name'),
+        audio.get('codec_name'),
+        video.get('width'),
+        video.get('height'),
+        video.get('r_frame_rate'),
+        video.get('time_base'),
+        video.get('pix_fmt'),
+        audio.get('sample_rate'),
+        audio.get('channels')
+    )
+
+def _concat_filter_cmd(input_files: List[str], probes: List[tuple], output_file: str) -> List[str]:
+    """Build a re-encoding concat filter command for mismatched inputs"""
+    width, height = probes[0][2] or 1280, probes[0][3] or 720
+    with_audio = all(probe[1] for probe in probes)
+
+    cmd = ['ffmpeg', '-nostats']
+    for file in input_files:
+        cmd += ['-i', file]
+
+    filters_, pads = [], ""
+    for idx in range(len(input_files)):
+        # concat filter needs identical frame sizes
+        filters_.append(
+            f"[{idx}:v]scale={width}:{height}:force_original_aspect_ratio=decrease,"
+            f"pad={width}:{height}:(ow-iw)/2:(oh-ih)/2,setsar=1[v{idx}]"
+        )
+        pads += f"[v{idx}]" + (f"[{idx}:a]" if with_audio else "")
+    filters_.append(
+        f"{pads}concat=n={len(input_files)}:v=1:a={int(with_audio)}[v]"
+        + ("[a]" if with_audio else "")
+    )
+
+    cmd += ['-filter_complex', ";".join(filters_), '-map', '[v]']
+    if with_audio:
+        cmd += ['-map', '[a]', '-c:a', 'aac']
+    cmd += ['-c:v', 'libx264', '-preset', 'veryfast', '-crf', '23', output_file, '-y']
+    return cmd
+
+async def merge_videos_ffmpeg(input_files: List[str], output_file: str):
+    """Merge videos using FFmpeg"""
+    sem = asyncio.Semaphore(MAX_PARALLEL_PROBES)
+
+    async def _bounded_probe(path: str) -> tuple:
+        async with sem:
+            return await _probe(path)
+
+    probes = await asyncio.gather(*[_bounded_probe(file) for file in input_files])
+    list_file = None
+
+    if all(probe == probes[0] for probe in probes):
+        # Identical streams: lossless concat demuxer, no transcode
+        list_file = f"{output_file}.txt"
+        await asyncio.to_thread(_write_list, list_file, input_files)
+        cmd = [
+            'ffmpeg',
+            '-nostats',
+            '-f', 'concat',
+            '-safe', '0',
+            '-i', list_file,
+            '-c', 'copy',
+            output_file,
+            '-y'
+        ]
+    else:
+        logger.info(f"Input streams differ, re-encoding: {probes}")
+        cmd = _concat_filter_cmd(input_files, probes, output_file)
+
+    proc = await asyncio.create_subprocess_exec(
+        *cmd,
+        stdout=asyncio.subprocess.DEVNULL,
         stderr=asyncio.subprocess.PIPE
     )
 
-    await proc.communicate()
-    os.remove(list_file)
+    # Stream stderr instead of buffering it all, keeping only the tail
+    stderr_tail = deque(maxlen=20)
+    async for line in proc.stderr:
+        stderr_tail.append(line.decode(errors='ignore').rstrip())
+    await proc.wait()
+    if list_file:
+        await asyncio.to_thread(os.remove, list_file)
+
+    if proc.returncode != 0:
+        logger.error("FFmpeg failed:\n" + "\n".join(stderr_tail))
+        raise RuntimeError(stderr_tail[-1] if stderr_tail else "FFmpeg failed")
 
 async def progress_callback(current, total, status_msg, start_time):
     """Upload progress callback"""
     try:
         percent = current * 100 / total
+        now = time.monotonic()
+        # Edit at most every PROGRESS_EDIT_INTERVAL seconds and only on a new percent
+        if current != total and (
+            now < getattr(status_msg, "_next_edit", 0)
+            or int(percent) == getattr(status_msg, "_last_pct", -1)
+        ):
+            return
+        status_msg._next_edit = now + PROGRESS_EDIT_INTERVAL
+        status_msg._last_pct = int(percent)
+
         speed = current / (time.time() - start_time)
         eta = (total - current) / speed
         
@@ -254,6 +516,9 @@ async def progress_callback(current, total, status_msg, start_time):
         )
         
         await status_msg.edit_text(text)
+    except FloodWait as e:
+        # Skip edits until the wait is over rather than stalling the upload
+        status_msg._next_edit = time.monotonic() + e.value
     except Exception as e:
         logger.error(f"Progress error: {e}")
 
@@ -274,10 +539,7 @@ async def show_queue(client: VideoMergerBot, message: Message):
 
     await message.reply_text(
         queue_text,
-        reply_markup=InlineKeyboardMarkup([
-            [InlineKeyboardButton("Merge Now", callback_data="merge_now")],
-            [InlineKeyboardButton("Clear Queue", callback_data="clear_queue")]
-        ])
+        reply_markup=QUEUE_MARKUP
     )
 
 if __name__ == "__main__":
@@ -10,6 +10,8 @@ from pyrogram.types import CallbackQuery, Message
 
 from helpers.display_progress import Progress
 
+_userbot_lock = asyncio.Lock()
+
 
 async def uploadVideo(
     c: Client,
@@ -26,44 +28,48 @@ async def uploadVideo(
     if Config.IS_PREMIUM:
         sent_ = None
         prog = Progress(cb.from_user.id, c, cb.message)
-        async with userBot:
-            if upload_mode is False:
-                c_time = time.time()
-                sent_: Message = await userBot.send_video(
-                    chat_id=int(LOGCHANNEL),
-                    video=merged_video_path,
-                    height=height,
-                    width=width,
-                    duration=duration,
-                    thumb=video_thumbnail,
-                    caption=f"`{merged_video_path.rsplit('/',1)[-1]}`\n\nMerged for: {cb.from_user.mention}",
-                    progress=prog.progress_for_pyrogram,
-                    progress_args=(
-                        f"Uploading: `{merged_video_path.rsplit('/',1)[-1]}`",
-                        c_time,
-                    ),
-                )
-            else:
-                c_time = time.time()
-                sent_: Message = await userBot.send_document(
-                    chat_id=int(LOGCHANNEL),
-                    document=merged_video_path,
-                    thumb=video_thumbnail,
-                    caption=f"`{merged_video_path.rsplit('/',1)[-1]}`\n\nMerged for: <a href='tg://user?id={cb.from_user.id}'>{cb.from_user.first_name}</a>",
-                    progress=prog.progress_for_pyrogram,
-                    progress_args=(
-                        f"Uploading: `{merged_video_path.rsplit('/',1)[-1]}`",
-                        c_time,
-                    ),
-                )
-            if sent_ is not None:
-                await c.copy_message(
-                    chat_id=cb.message.chat.id,
-                    from_chat_id=sent_.chat.id,
-                    message_id=sent_.id,
-                    caption=f"`{merged_video_path.rsplit('/',1)[-1]}`",
-                )
-                # await sent_.delete()
+        # keep the premium session connected across uploads instead of
+        # re-running the MTProto handshake for every file
+        async with _userbot_lock:
+            if not userBot.is_connected:
+                await userBot.start()
+        if upload_mode is False:
+            c_time = time.time()
+            sent_: Message = await userBot.send_video(
+                chat_id=int(LOGCHANNEL),
+                video=merged_video_path,
+                height=height,
+                width=width,
+                duration=duration,
+                thumb=video_thumbnail,
+                caption=f"`{merged_video_path.rsplit('/',1)[-1]}`\n\nMerged for: {cb.from_user.mention}",
+                progress=prog.progress_for_pyrogram,
+                progress_args=(
+                    f"Uploading: `{merged_video_path.rsplit('/',1)[-1]}`",
+                    c_time,
+                ),
+            )
+        else:
+            c_time = time.time()
+            sent_: Message = await userBot.send_document(
+                chat_id=int(LOGCHANNEL),
+                document=merged_video_path,
+                thumb=video_thumbnail,
+                caption=f"`{merged_video_path.rsplit('/',1)[-1]}`\n\nMerged for: <a href='tg://user?id={cb.from_user.id}'>{cb.from_user.first_name}</a>",
+                progress=prog.progress_for_pyrogram,
+                progress_args=(
+                    f"Uploading: `{merged_video_path.rsplit('/',1)[-1]}`",
+                    c_time,
+                ),
+            )
+        if sent_ is not None:
+            await c.copy_message(
+                chat_id=cb.message.chat.id,
+                from_chat_id=sent_.chat.id,
+                message_id=sent_.id,
+                caption=f"`{merged_video_path.rsplit('/',1)[-1]}`",
+            )
+            # await sent_.delete()
     else:
         try:
             sent_ = None
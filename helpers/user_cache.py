@@ -0,0 +1,46 @@
+import asyncio
+import time
+from collections import OrderedDict
+
+from helpers.utils import UserSettings
+
+MAX_CACHED_USERS = 1024
+
+_cache: "OrderedDict[int, tuple[float, UserSettings]]" = OrderedDict()
+_loading: dict[int, asyncio.Task] = {}
+
+
+async def _load(uid: int, name: str) -> UserSettings:
+    task = asyncio.current_task()
+    try:
+        # UserSettings() reads (and may write) mongo synchronously
+        user = await asyncio.to_thread(UserSettings, uid, name)
+        # skip the write if invalidate_user() ran while we were loading
+        if _loading.get(uid) is task:
+            _cache[uid] = (time.monotonic(), user)
+            _cache.move_to_end(uid)
+            while len(_cache) > MAX_CACHED_USERS:
+                _cache.popitem(last=False)
+        return user
+    finally:
+        if _loading.get(uid) is task:
+            _loading.pop(uid, None)
+
+
+async def get_user(uid: int, name: str, ttl: int = 30) -> UserSettings:
+    """Return cached UserSettings for uid, reloading from database after ttl seconds"""
+    hit = _cache.get(uid)
+    if hit is not None and time.monotonic() - hit[0] < ttl:
+        _cache.move_to_end(uid)
+        return hit[1]
+    # share one in-flight load per uid instead of locking every lookup
+    task = _loading.get(uid)
+    if task is None:
+        task = _loading[uid] = asyncio.create_task(_load(uid, name))
+    return await asyncio.shield(task)
+
+
+def invalidate_user(uid: int):
+    """Drop cached settings so the next lookup hits the database"""
+    _cache.pop(uid, None)
+    _loading.pop(uid, None)
@@ -11,6 +11,7 @@ from pyromod.types import ListenerTypes
 from pyromod.listen import Client
 
 from helpers import database
+from helpers.user_cache import get_user, invalidate_user
 from helpers.utils import UserSettings
 from bot import (
     LOGGER,
@@ -143,7 +144,7 @@ async def callback_handler(c: Client, cb: CallbackQuery):
         return
 
     elif cb.data.startswith("rename_"):
-        user = UserSettings(cb.from_user.id, cb.from_user.first_name)
+        user = await get_user(cb.from_user.id, cb.from_user.first_name)
         if "YES" in cb.data:
             await cb.message.edit(
                 "Current filename: **[@yashoswalyo]_merged.mkv**\n\nSend me new file name without extension: You have 1 minute"
@@ -212,8 +213,9 @@ async def callback_handler(c: Client, cb: CallbackQuery):
         LOGGER.info(queueDB.get(cb.from_user.id)["videos"])
         LOGGER.info(queueDB.get(cb.from_user.id)["subtitles"])
         sIndex = queueDB.get(cb.from_user.id)["videos"].index(message_id)
-        m = await c.get_messages(chat_id=cb.message.chat.id, message_ids=message_id)
-        if queueDB.get(cb.from_user.id)["subtitles"][sIndex] is None:
+        sMessId = queueDB.get(cb.from_user.id)["subtitles"][sIndex]
+        if sMessId is None:
+            m = await c.get_messages(chat_id=cb.message.chat.id, message_ids=message_id)
             try:
                 await cb.message.edit(
                     text=f"File Name: {m.video.file_name}",
@@ -254,8 +256,10 @@ async def callback_handler(c: Client, cb: CallbackQuery):
                 )
             return
         else:
-            sMessId = queueDB.get(cb.from_user.id)["subtitles"][sIndex]
-            s = await c.get_messages(chat_id=cb.message.chat.id, message_ids=sMessId)
+            # fetch video and subtitle messages in one request
+            m, s = await c.get_messages(
+                chat_id=cb.message.chat.id, message_ids=[message_id, sMessId]
+            )
             try:
                 await cb.message.edit(
                     text=f"File Name: {m.video.file_name}\n\nSubtitles: {s.document.file_name}",
@@ -386,6 +390,7 @@ async def callback_handler(c: Client, cb: CallbackQuery):
         mode = int(cb.data.split("_")[2])
         user.merge_mode = mode
         user.set()
+        invalidate_user(int(uid))
         await userSettings(
             cb.message, int(uid), cb.from_user.first_name, cb.from_user.last_name, user
         )
@@ -400,6 +405,7 @@ async def callback_handler(c: Client, cb: CallbackQuery):
         user = UserSettings(uid, cb.from_user.first_name)
         user.edit_metadata = False if user.edit_metadata else True
         user.set()
+        invalidate_user(uid)
         await userSettings(
             cb.message, uid, cb.from_user.first_name, cb.from_user.last_name, user
         )
@@ -12,7 +12,6 @@ from helpers.ffmpeg_helper import MergeSub, MergeVideo, take_screen_shot
 from helpers.rclone_upload import rclone_driver, rclone_upload
 from helpers.uploader import uploadVideo
 from helpers.utils import UserSettings
-from PIL import Image
 from pyrogram import Client
 from pyrogram.errors import MessageNotModified
 from pyrogram.errors.rpc_error import UnknownError
@@ -184,6 +183,8 @@ chat_id=cb.from_user.id, message_ids=list_message_ids ):
     width = 1280
     height = 720
     try:
+        from PIL import Image
+
         thumb = extractMetadata(createParser(video_thumbnail))
         height = thumb.get("height")
         width = thumb.get("width")
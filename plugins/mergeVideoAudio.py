@@ -12,7 +12,6 @@ from helpers.ffmpeg_helper import MergeAudio, take_screen_shot
 from helpers.rclone_upload import rclone_driver, rclone_upload
 from helpers.uploader import uploadVideo
 from helpers.utils import UserSettings
-from PIL import Image
 from pyrogram import Client
 from pyrogram.errors import MessageNotModified
 from pyrogram.types import CallbackQuery, Message
@@ -146,6 +145,8 @@ async def mergeAudio(c: Client, cb: CallbackQuery, new_file_name: str):
     width = 1280
     height = 720
     try:
+        from PIL import Image
+
         thumb = extractMetadata(createParser(video_thumbnail))
         height = thumb.get("height")
         width = thumb.get("width")
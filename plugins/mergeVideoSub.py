@@ -21,7 +21,6 @@ from helpers.ffmpeg_helper import MergeSubNew, take_screen_shot
 from helpers.rclone_upload import rclone_driver, rclone_upload
 from helpers.uploader import uploadVideo
 from helpers.utils import UserSettings
-from PIL import Image
 from pyrogram import Client
 from pyrogram.errors import MessageNotModified
 from pyrogram.errors.exceptions.flood_420 import FloodWait
@@ -161,6 +160,8 @@ async def mergeSub(c: Client, cb: CallbackQuery, new_file_name: str):
     width = 1280
     height = 720
     try:
+        from PIL import Image
+
         thumb = extractMetadata(createParser(video_thumbnail))
         height = thumb.get("height")
         width = thumb.get("width")